@@ -1,5 +1,8 @@
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 import logging
+from numba import njit
+import numpy as np
 from rainbow_logging_handler import RainbowLoggingHandler
 import sys
 
@@ -8,10 +11,32 @@ from .checker import AbstractChecker
 from graphs.generate_service import ServiceGMLGraph, InfrastructureGMLGraph
 
 
+def _configure_logger(log):
+    """
+    Sets up the colored stderr handler of a mapper logger once, so it is shared by all instances of the mapper.
+    If the application has already configured logging, or has set up this logger itself, it is left untouched
+    and the records propagate to the handlers of the application.
+
+    :param log: logging.Logger
+    :return:
+    """
+    if log.handlers or logging.getLogger().handlers:
+        return
+    handler = RainbowLoggingHandler(sys.stderr, color_funcName=('black', 'yellow', True))
+    formatter = logging.Formatter('%(asctime)s(%(name).6s)%(levelname).3s: %(message)s')
+    handler.setFormatter(formatter)
+    log.addHandler(handler)
+    if log.level == logging.NOTSET:
+        log.setLevel(logging.INFO)
+    # records are printed by the handler above, they should not be printed again by a root handler added later
+    log.propagate = False
+
+
 class UnfeasibleBinPacking(Exception):
 
     def __init__(self, msg, *args, **kwargs):
-        super(UnfeasibleBinPacking, self).__init__(*args, **kwargs)
+        # msg is passed on to be kept in args, so the exception can be pickled back from a worker process
+        super(UnfeasibleBinPacking, self).__init__(msg, *args, **kwargs)
         self.msg = msg
 
 
@@ -41,30 +66,41 @@ class VolatileResourcesChecker(AbstractChecker):
         return ns.check_graph()
 
 
-class Item(dict):
+class Item(object):
+
+    __slots__ = ('id', 'weight', 'node_dict', 'possible_bins', 'mapped_to', 'seq', 'idx', '_allowed_bin_ids')
 
-    def __init__(self, id, weight, node_dict, possible_bins, seq=None, mapped_to = None, **kwargs):
+    def __init__(self, id, weight, node_dict, possible_bins, seq=None, mapped_to = None):
         """
         Class to store information about an item of the bin packing problem.
-        The mapped_to key represents the Bin object bin where this is mapped, None by default.
+        The mapped_to attribute represents the Bin object bin where this is mapped, None by default.
 
         :param weight:  weight to be used for placement
         :param node_dict: dictionary of the correspoinding VNF read from the input
         :param seq:
-        :param possible_bins: list of Bin objects where this item might possibly go.
-        :param kwargs:
+        :param possible_bins: iterable of Bin objects where this item might possibly go, stored as a set.
         """
-        super(Item, self).__init__(seq=seq, id=id, node_dict=node_dict, weight=weight, **kwargs)
+        self.id = id
+        self.weight = weight
+        self.node_dict = node_dict
+        self.seq = seq
         self.mapped_to = mapped_to
-        self.possible_bins = possible_bins
+        self.possible_bins = set(possible_bins)
+        # index of the item in the arrays of the mapper, set when the item is added to the problem
+        self.idx = None
+        # frozenset of the bin ids allowed by the location constraint, set by PruneLocalityConstraints
+        self._allowed_bin_ids = None
 
     def __repr__(self):
-        return "Item(id={}, weight={}, mapped_to={})".format(self['id'], self['weight'], self.mapped_to)
+        return "Item(id={}, weight={}, mapped_to={})".format(self.id, self.weight, self.mapped_to)
 
 
-class Bin(dict):
+class Bin(object):
 
-    def __init__(self, id, capacity, fixed_cost, unit_cost, node_dict, mapped_here, seq=None, **kwargs):
+    __slots__ = ('id', 'capacity', 'fixed_cost', 'unit_cost', 'node_dict', 'mapped_here', 'seq', '_total_load',
+                 'preference', 'idx', 'filled_unit_cost')
+
+    def __init__(self, id, capacity, fixed_cost, unit_cost, node_dict, mapped_here, seq=None):
         """
         Class to store and calculate info for a bin of the bin packing problem.
         The mapped_here attribute stores the items mapped here.
@@ -75,37 +111,102 @@ class Bin(dict):
         :param unit_cost:
         :param node_dict:
         :param seq:
-        :param kwargs:
         """
-        super(Bin, self).__init__(seq=seq, id=id, capacity=capacity, fixed_cost=fixed_cost,
-                                  unit_cost=unit_cost, node_dict=node_dict, **kwargs)
+        self.id = id
+        self.capacity = capacity
+        self.fixed_cost = fixed_cost
+        self.unit_cost = unit_cost
+        self.node_dict = node_dict
+        self.seq = seq
         self.mapped_here = mapped_here
+        self._total_load = sum(i.weight for i in mapped_here)
         self.preference = None
-
-    @property
-    def filled_unit_cost(self):
-        if self['capacity'] > 0:
-            fixed_part = self['fixed_cost'] / self['capacity']
-        else:
-            fixed_part = float('inf')
-        return fixed_part + self['unit_cost']
+        # index of the bin in the arrays of the mapper, set when the bin is added to the problem
+        self.idx = None
+        # the parameters of the bin never change, so the sorting key is calculated only once
+        self.filled_unit_cost = (fixed_cost / capacity if capacity > 0 else float('inf')) + unit_cost
 
     @property
     def total_load(self):
-        return sum(map(lambda i: i['weight'], self.mapped_here))
+        return self._total_load
 
     @property
     def is_overloaded(self):
-        return self['capacity'] < self.total_load
+        return self.capacity < self._total_load
 
     def does_item_fit(self, item):
-        return self['capacity'] >= self.total_load + item['weight']
+        return self.capacity >= self._total_load + item.weight
+
+    def add_item(self, item):
+        """
+        Appends the item to the mapped_here list and keeps the total load up to date.
+        Within a mapper use ConstructiveMapperFromFractional.map_item_to_bin instead, calling this directly
+        leaves the arrays of the mapper (and so the loads seen by find_cheapest_move) stale.
+
+        :param item:
+        :return:
+        """
+        self.mapped_here.append(item)
+        self._total_load += item.weight
+
+    def remove_item(self, item):
+        """
+        Removes the item from the mapped_here list and keeps the total load up to date.
+        Within a mapper use ConstructiveMapperFromFractional.unmap_item_from_bin instead, calling this directly
+        leaves the arrays of the mapper (and so the loads seen by find_cheapest_move) stale.
+
+        :param item:
+        :return:
+        """
+        self.mapped_here.remove(item)
+        self._total_load -= item.weight
 
     def get_variable_cost_of_mapping(self, item):
-        return item['weight'] * self['unit_cost']
+        return item.weight * self.unit_cost
 
     def __repr__(self):
-        return "Bin(id={}, capacity={})".format(self['id'], self['capacity'])
+        return "Bin(id={}, capacity={})".format(self.id, self.capacity)
+
+
+@njit(cache=True)
+def find_cheapest_move(overloading_items, mapped_idx, weights, unit_costs, capacities, loads, best_bins_by_unit_cost,
+                       possible):
+    """
+    Finds the move of an overloading item to a best bin, which increases the objective the least.
+    The cheapest relocation of an item is to the possible bin with the lowest unit cost where it fits,
+    so only the first such bin is checked for each item.
+
+    :param overloading_items: indices of the items in the overloaded bins
+    :param mapped_idx: bin index of each item
+    :param weights: weight of each item
+    :param unit_costs: unit cost of each bin
+    :param capacities: capacity of each bin
+    :param loads: total weight of the items mapped to each bin
+    :param best_bins_by_unit_cost: indices of the best bins ordered by their unit costs
+    :param possible: 2D uint64 array, bit b % 64 of word b // 64 in row i is set if bin b is a possible bin of item i
+    :return: tuple of the item index and the target bin index, (-1, -1) if no item can be moved
+    """
+    cost_of_cheapest_improvement = np.inf
+    item_to_be_moved = -1
+    target_bin = -1
+    for i in overloading_items:
+        current_bin = mapped_idx[i]
+        weight = weights[i]
+        # the cost of the current mapping is the same for all the candidate bins of the item
+        current_cost = weight * unit_costs[current_bin]
+        for b in best_bins_by_unit_cost:
+            is_possible = (possible[i, b >> 6] >> np.uint64(b & 63)) & np.uint64(1)
+            if is_possible and b != current_bin and capacities[b] >= loads[b] + weight:
+                # Difference between the current mapping and the possible relocation.
+                # This value might be even negative, if the rounding did not consider taking the first fitting bin in the
+                # ordered best bin list.
+                cost_of_improvement = weight * unit_costs[b] - current_cost
+                if cost_of_improvement < cost_of_cheapest_improvement:
+                    cost_of_cheapest_improvement = cost_of_improvement
+                    item_to_be_moved = i
+                    target_bin = b
+                break
+    return item_to_be_moved, target_bin
 
 
 class BasePruningStep(metaclass=ABCMeta):
@@ -140,11 +241,10 @@ class PruneLocalityConstraints(BasePruningStep):
         :return:
         """
         for item in items:
-            if ns.location_constr_str in item['node_dict']:
-                # we need to make a list from the bins, otherwise we couldnt remove from it
-                for bin in list(item.possible_bins):
-                    if bin['id'] not in item['node_dict'][ns.location_constr_str]:
-                        item.possible_bins.remove(bin)
+            location_constr = item.node_dict.get(ns.location_constr_str)
+            if location_constr is not None:
+                item._allowed_bin_ids = frozenset(location_constr)
+                item.possible_bins = {bin for bin in item.possible_bins if bin.id in item._allowed_bin_ids}
         return items, bins
 
 
@@ -170,12 +270,26 @@ class ConstructiveMapperFromFractional(AbstractMapper):
         self.pruning_steps_collection = [PruneLocalityConstraints()]
         self.objective_value_of_fractional_opt = None
         self.objective_value_of_integer_solution = None
-        self.log = logging.Logger(self.__class__.__name__)
-        handler = RainbowLoggingHandler(sys.stderr, color_funcName=('black', 'yellow', True))
-        formatter = logging.Formatter('%(asctime)s(%(name).6s)%(levelname).3s: %(message)s')
-        handler.setFormatter(formatter)
-        self.log.addHandler(handler)
-        self.log.setLevel(logging.INFO)
+        # bins sorted once by their filled unit cost, and the index of the next one to be introduced to the best bins
+        self._bins_by_cost = []
+        self._next_bin_idx = 0
+        # item weights and bin parameters as arrays, indexed by the order of self.items and Bin.idx respectively
+        self._weights = np.empty(0)
+        self._capacities = np.empty(0)
+        self._fixed_costs = np.empty(0)
+        self._unit_costs = np.empty(0)
+        self._total_item_weight = 0.0
+        # bin index of each item, -1 if it is not mapped
+        self._mapped_idx = np.empty(0, dtype=np.int64)
+        # total weight of the items mapped to each bin, updated in the same order as Bin.total_load
+        self._loads = np.empty(0)
+        # possible bins of each item as a row of 64 bit masks, see set_possible_bins_matrix
+        self._possible = np.empty((0, 0), dtype=np.uint64)
+        self._best_bins_by_unit_cost = np.empty(0, dtype=np.int64)
+        # the best bins list which _best_bins_by_unit_cost was sorted from
+        self._sorted_best_bins = []
+        self.log = logging.getLogger(self.__class__.__name__)
+        _configure_logger(self.log)
 
         # these might not be needed if we override the functions with other heuristics.
         self.epsilon = 1e-3
@@ -183,7 +297,8 @@ class ConstructiveMapperFromFractional(AbstractMapper):
 
     @property
     def total_item_weight(self):
-         return sum(map(lambda i: i['weight'], self.items))
+        # the items do not change during the mapping, so it is calculated only once in get_base_bin_packing_problem
+        return self._total_item_weight
 
     def get_bins_sorted_by_filled_unit_cost(self):
         return sorted(self.bins, key=lambda b: b.filled_unit_cost)
@@ -200,38 +315,45 @@ class ConstructiveMapperFromFractional(AbstractMapper):
             # TODO: fill in from values of the node based on checker.
             # TODO (we might filter out APs and endpoints here already -- If we know what exactly will be their 'type' fields)
             # initialize the problem with all possible bins
-            self.items.append(Item(n, node_dict[ns.nf_demand_str], node_dict, possible_bins=[]))
-        min_weighted_item = min(self.items, key=lambda i: i['weight'])
+            item = Item(n, node_dict[ns.nf_demand_str], node_dict, possible_bins=set())
+            item.idx = len(self.items)
+            self.items.append(item)
+        min_weighted_item = min(self.items, key=lambda i: i.weight)
         for n, node_dict in infra.nodes(data=True):
             # TODO: fill in from values of the node based on checker.
             bin = Bin(n, node_dict[infra.infra_node_capacity_str], node_dict[infra.infra_fixed_cost_str],
                       node_dict[infra.infra_unit_cost_str], node_dict, mapped_here=[])
-            if bin['capacity'] >= min_weighted_item['weight']:
+            if bin.capacity >= min_weighted_item.weight:
+                bin.idx = len(self.bins)
                 self.bins.append(bin)
-            elif bin['capacity'] > self.epsilon:
-                self.log.info("Discarding bin {} because it cannot fit even the smallest item".format(bin))
+            elif bin.capacity > self.epsilon:
+                self.log.info("Discarding bin %s because it cannot fit even the smallest item", bin)
         if len(self.bins) == 0:
             raise UnfeasibleBinPacking("None of the bins can host the smallest item!")
         for item in self.items:
-            # important to have a separate list for the possible bins for each item
+            # important to have a separate set for the possible bins for each item
             # (removing from one, Must not be reflected in another item's possible bins)
-            item.possible_bins.extend(self.bins)
+            item.possible_bins.update(self.bins)
+        self._weights = np.fromiter((i.weight for i in self.items), dtype=float, count=len(self.items))
+        self._capacities = np.fromiter((b.capacity for b in self.bins), dtype=float, count=len(self.bins))
+        self._fixed_costs = np.fromiter((b.fixed_cost for b in self.bins), dtype=float, count=len(self.bins))
+        self._unit_costs = np.fromiter((b.unit_cost for b in self.bins), dtype=float, count=len(self.bins))
+        self._mapped_idx = np.full(len(self.items), -1, dtype=np.int64)
+        self._loads = np.zeros(len(self.bins))
+        self._total_item_weight = float(self._weights.sum())
 
     def set_initial_bin_preferences(self, original_best_bins, total_bin_capacity):
         # sets the preference to the same ordering which is given by the fractional mapping variables for the best bins
-        min_pref = float('inf')
-        self.objective_value_of_fractional_opt = 0.0
-        for bin in original_best_bins:
-            if bin is original_best_bins[-1]:
-                # the last item has less preference than its capacity
-                bin.preference = self.total_item_weight - (total_bin_capacity - bin['capacity'])
-            else:
-                bin.preference = bin['capacity']
-            self.objective_value_of_fractional_opt += bin['fixed_cost'] + bin.preference * bin['unit_cost']
-            if bin.preference < min_pref:
-                min_pref = bin.preference
-        self.min_bin_preference = min_pref
-        self.log.debug("Minimum bin preference set to {}".format(self.min_bin_preference))
+        best_idx = np.fromiter((b.idx for b in original_best_bins), dtype=int, count=len(original_best_bins))
+        preferences = self._capacities[best_idx]
+        # the last item has less preference than its capacity
+        preferences[-1] = self.total_item_weight - (total_bin_capacity - preferences[-1])
+        for bin, preference in zip(original_best_bins, preferences.tolist()):
+            bin.preference = preference
+        self.objective_value_of_fractional_opt = float(self._fixed_costs[best_idx].sum() +
+                                                       (preferences * self._unit_costs[best_idx]).sum())
+        self.min_bin_preference = float(preferences.min())
+        self.log.debug("Minimum bin preference set to %s", self.min_bin_preference)
 
     def get_fist_best_bins(self):
         """
@@ -240,18 +362,49 @@ class ConstructiveMapperFromFractional(AbstractMapper):
 
         :return: sorted best bins
         """
-        sorted_bins = self.get_bins_sorted_by_filled_unit_cost()
-        total_bin_capacity = 0.0
-        best_bins = []
-        for bin in sorted_bins:
-            total_bin_capacity += bin['capacity']
-            best_bins.append(bin)
-            if total_bin_capacity >= self.total_item_weight:
-                self.set_initial_bin_preferences(best_bins, total_bin_capacity)
-                return best_bins
-        else:
+        self._bins_by_cost = self.get_bins_sorted_by_filled_unit_cost()
+        sorted_idx = np.fromiter((b.idx for b in self._bins_by_cost), dtype=int, count=len(self._bins_by_cost))
+        cumulative_capacities = np.cumsum(self._capacities[sorted_idx])
+        total_item_weight = self.total_item_weight
+        # index of the first bin, where the cumulative capacity reaches the total item weight
+        k = int(np.searchsorted(cumulative_capacities, total_item_weight, side='left')) + 1
+        if k > len(self._bins_by_cost):
             raise UnfeasibleBinPacking("Total item weight {} is more than all the bin capacities {}".
-                                       format(self.total_item_weight, total_bin_capacity))
+                                       format(total_item_weight, float(cumulative_capacities[-1])))
+        best_bins = self._bins_by_cost[:k]
+        self.set_initial_bin_preferences(best_bins, float(cumulative_capacities[k - 1]))
+        self._next_bin_idx = k
+        return best_bins
+
+    def set_possible_bins_matrix(self):
+        """
+        Stores the (pruned) possible bins of the items as a 2D bitmap for the improvement search.
+        Bin b is represented by bit b % 64 of the b // 64-th uint64 word in the row of the item.
+
+        :return:
+        """
+        n_words = (len(self.bins) + 63) // 64
+        n_pairs = sum(len(item.possible_bins) for item in self.items)
+        item_idx = np.repeat(np.fromiter((item.idx for item in self.items), dtype=np.int64, count=len(self.items)),
+                             [len(item.possible_bins) for item in self.items])
+        bin_idx = np.fromiter((bin.idx for item in self.items for bin in item.possible_bins), dtype=np.int64,
+                              count=n_pairs)
+        possible = np.zeros((len(self.items), n_words * 64), dtype=bool)
+        possible[item_idx, bin_idx] = True
+        # with little bit order byte k holds bins 8k..8k+7, so each little-endian 8 byte group is one word
+        self._possible = np.packbits(possible, axis=1, bitorder='little').view('<u8').astype(np.uint64, copy=False)
+
+    def sort_best_bins_by_unit_cost(self, best_bins):
+        """
+        Orders the best bins by their unit costs, so the cheapest relocation of an item is the first one where it fits.
+        The sort is stable, so bins with equal unit costs keep their order in the best bins.
+
+        :param best_bins:
+        :return:
+        """
+        self._sorted_best_bins = list(best_bins)
+        self._best_bins_by_unit_cost = np.array([b.idx for b in sorted(best_bins, key=lambda b: b.unit_cost)],
+                                                dtype=np.int64)
 
     def map_all_items_to_bins(self, best_bins, infra, ns):
         """
@@ -266,21 +419,47 @@ class ConstructiveMapperFromFractional(AbstractMapper):
         :param ns:
         :return:
         """
+        # the sort is stable, so the first possible bin has the highest preference, the earliest one in case of ties
+        best_bins_by_preference = sorted(best_bins, key=lambda b: -b.preference)
         for item in self.items:
-            best_and_possible_bins = [b for b in best_bins if b in item.possible_bins]
-            if len(best_and_possible_bins) > 0:
-                chosen_bin = max(best_and_possible_bins, key=lambda b: b.preference)
-                item.mapped_to = chosen_bin
-                chosen_bin.mapped_here.append(item)
+            chosen_bin = next((b for b in best_bins_by_preference if b in item.possible_bins), None)
+            if chosen_bin is not None:
+                self.map_item_to_bin(item, chosen_bin)
             elif len(item.possible_bins) == 1:
-                item.mapped_to = item.possible_bins[0]
-                item.possible_bins[0].mapped_here.append(item)
+                self.map_item_to_bin(item, next(iter(item.possible_bins)))
             elif len(item.possible_bins) > 1:
                 raise NotImplementedError("Bin packing heuristic is not implemented for unambiguous initial mapping outside of the "
                                           "best bins provided by the fractional optimal solution")
             else:
                 raise UnfeasibleBinPacking("Item {} cannot be mapped anywhere".format(item))
 
+    def map_item_to_bin(self, item, bin):
+        """
+        Maps the item to the bin, keeping the Bin object and the item/bin arrays of the mapper in sync.
+
+        :param item:
+        :param bin:
+        :return:
+        """
+        item.mapped_to = bin
+        bin.add_item(item)
+        self._mapped_idx[item.idx] = bin.idx
+        self._loads[bin.idx] += item.weight
+
+    def unmap_item_from_bin(self, item):
+        """
+        Removes the item from the bin where it is mapped, keeping the Bin object and the item/bin arrays
+        of the mapper in sync.
+
+        :param item:
+        :return:
+        """
+        bin = item.mapped_to
+        bin.remove_item(item)
+        self._loads[bin.idx] -= item.weight
+        self._mapped_idx[item.idx] = -1
+        item.mapped_to = None
+
     def improve_item_to_bin_mappings(self, best_bins, infra, ns):
         """
         Moves the item, which increases the objective the least, to one of the best bins where it fits.
@@ -290,6 +469,9 @@ class ConstructiveMapperFromFractional(AbstractMapper):
         :param ns:
         :return: bool, whether there is anything left to improve
         """
+        if self._sorted_best_bins != best_bins:
+            # the best bins were changed without sorting them again, e.g. by an overridden get_new_best_bins
+            self.sort_best_bins_by_unit_cost(best_bins)
         overloading_items = []
         for bin in best_bins:
             if bin.is_overloaded:
@@ -297,31 +479,20 @@ class ConstructiveMapperFromFractional(AbstractMapper):
         if len(overloading_items) == 0:
             return False
         else:
-            cost_of_cheapest_improvement = float('inf')
-            target_bin = None
-            item_to_be_moved = None
-            for item in overloading_items:
-                for bin in best_bins:
-                    if bin.does_item_fit(item) and bin is not item.mapped_to and bin in item.possible_bins:
-                        # Difference between the current mapping and the possible relocation.
-                        # This value might be even negative, if the rounding did not consider taking the first fitting bin in the
-                        # ordered best bin list.
-                        cost_of_improvement = bin.get_variable_cost_of_mapping(item) - \
-                                              item.mapped_to.get_variable_cost_of_mapping(item)
-                        if cost_of_improvement < cost_of_cheapest_improvement:
-                            cost_of_cheapest_improvement = cost_of_improvement
-                            target_bin = bin
-                            item_to_be_moved = item
-            if target_bin is not None:
-                self.log.debug("Improving mapping by moving item {} to target bin {}".
-                               format(item_to_be_moved, target_bin))
+            item_idx, bin_idx = find_cheapest_move(
+                np.fromiter((i.idx for i in overloading_items), dtype=np.int64, count=len(overloading_items)),
+                self._mapped_idx, self._weights, self._unit_costs, self._capacities, self._loads,
+                self._best_bins_by_unit_cost, self._possible)
+            if item_idx >= 0:
+                item_to_be_moved = self.items[item_idx]
+                target_bin = self.bins[bin_idx]
+                self.log.debug("Improving mapping by moving item %s to target bin %s", item_to_be_moved, target_bin)
                 # delete the mapping of the foudn item from its current mapping
                 if item_to_be_moved not in item_to_be_moved.mapped_to.mapped_here:
                     raise Exception("Item is not foudn in mapped_to of a bin where it should have been!")
-                item_to_be_moved.mapped_to.mapped_here.remove(item_to_be_moved)
-                target_bin.mapped_here.append(item_to_be_moved)
+                self.unmap_item_from_bin(item_to_be_moved)
                 # set its mapping to the target bin
-                item_to_be_moved.mapped_to = target_bin
+                self.map_item_to_bin(item_to_be_moved, target_bin)
                 # NOTE: even if this is the very last improvement, it will turn out in the next call of this function
                 return True
             else:
@@ -338,22 +509,33 @@ class ConstructiveMapperFromFractional(AbstractMapper):
         :param ns:
         :return:
         """
-        if self.check_bin_mapping():
+        if not self._has_overload_or_unmapped():
             # we dont have to add next bin, everything is mapped to the current best bins
             return best_bins, False
         else:
-            for bin in self.get_bins_sorted_by_filled_unit_cost():
-                if bin not in best_bins:
-                    best_bins.append(bin)
-                    # all later introduced bins are less and less preferred
-                    bin.preference = self.min_bin_preference - self.epsilon
-                    self.min_bin_preference = bin.preference
-                    self.log.info("Introducing next new bin {} with minimal preference {}".format(bin, bin.preference))
-                    # we return with the first one right away
-                    return best_bins, True
-            else:
+            if self._next_bin_idx >= len(self._bins_by_cost):
                 # it means, that all bins are already in the best bins.
                 return best_bins, False
+            # the best bins are always a prefix of the sorted bins, so the next one is the first not introduced yet
+            bin = self._bins_by_cost[self._next_bin_idx]
+            self._next_bin_idx += 1
+            best_bins.append(bin)
+            # all later introduced bins are less and less preferred
+            bin.preference = self.min_bin_preference - self.epsilon
+            self.min_bin_preference = bin.preference
+            self.log.info("Introducing next new bin %s with minimal preference %s", bin, bin.preference)
+            return best_bins, True
+
+    def _has_overload_or_unmapped(self) -> bool:
+        """
+        Cheap version of check_bin_mapping for the main loop, which does not verify the mapping structure
+        and does not calculate the objective value.
+
+        :return: bool, whether any item is unmapped or any bin is overloaded
+        """
+        if (self._mapped_idx < 0).any():
+            return True
+        return any(bin.is_overloaded for bin in self.bins)
 
     def check_bin_mapping(self):
         """
@@ -362,27 +544,24 @@ class ConstructiveMapperFromFractional(AbstractMapper):
 
         :return:
         """
-        self.objective_value_of_integer_solution = 0.0
-        for item in self.items:
-            if item.mapped_to is None:
-                self.objective_value_of_integer_solution = None
-                return False
-            else:
-                self.objective_value_of_integer_solution += item.mapped_to.get_variable_cost_of_mapping(item)
-        all_items = list(self.items)
+        self.objective_value_of_integer_solution = None
+        if any(item.mapped_to is None for item in self.items):
+            return False
+        mapped_idx = np.fromiter((item.mapped_to.idx for item in self.items), dtype=int, count=len(self.items))
+        loads = np.bincount(mapped_idx, weights=self._weights, minlength=len(self.bins))
+        if (loads > self._capacities).any():
+            return False
+        mapped_items = set()
         for bin in self.bins:
-            if bin.is_overloaded:
-                self.objective_value_of_integer_solution = None
-                return False
-            elif len(bin.mapped_here) > 0:
-                for item in bin.mapped_here:
-                    if item in all_items:
-                        all_items.remove(item)
-                    else:
-                        raise Exception("Wrong item mapping structure, each item must be in exactly one bin!")
-                self.objective_value_of_integer_solution += bin['fixed_cost']
-        if len(all_items) != 0:
+            for item in bin.mapped_here:
+                if item.mapped_to is not bin or item in mapped_items:
+                    raise Exception("Wrong item mapping structure, each item must be in exactly one bin!")
+                mapped_items.add(item)
+        if len(mapped_items) != len(self.items):
             raise Exception("Item not found in mapped_here structure in any bin!")
+        used_bins = np.bincount(mapped_idx, minlength=len(self.bins)) > 0
+        self.objective_value_of_integer_solution = float((self._weights * self._unit_costs[mapped_idx]).sum() +
+                                                         self._fixed_costs[used_bins].sum())
         return True
 
     def check_other_constraints(self, infra : InfrastructureGMLGraph, ns : ServiceGMLGraph):
@@ -393,19 +572,29 @@ class ConstructiveMapperFromFractional(AbstractMapper):
         :return:
         """
         for item in self.items:
-            if ns.location_constr_str in item['node_dict']:
-                if item.mapped_to['id'] not in item['node_dict'][ns.location_constr_str]:
-                    return False
+            allowed_bin_ids = item._allowed_bin_ids
+            if allowed_bin_ids is None and ns.location_constr_str in item.node_dict:
+                # the locality constraints were not pruned, so the frozenset is not built yet
+                allowed_bin_ids = frozenset(item.node_dict[ns.location_constr_str])
+            if allowed_bin_ids is not None and item.mapped_to.id not in allowed_bin_ids:
+                return False
         return True
 
     def construct_output_mapping(self, mapping):
         """
-
+        Fills in the host of each VNF keyed by the VNF id. The objective values of the integer and fractional
+        solutions are nested under the reserved 'objective_values' key, so they do not mix with the VNF ids.
 
         :param mapping:
         :return:
         """
         mapping['worked'] = True
+        for item in self.items:
+            mapping[item.id] = item.mapped_to.id
+        mapping['objective_values'] = {
+            'integer_solution': self.objective_value_of_integer_solution,
+            'fractional_opt': self.objective_value_of_fractional_opt
+        }
 
         return mapping
 
@@ -421,12 +610,14 @@ class ConstructiveMapperFromFractional(AbstractMapper):
         self.get_base_bin_packing_problem(infra, ns)
         for pruning in self.pruning_steps_collection:
             self.items, self.bins = pruning.prune_possible_mappings(infra, ns, self.items, self.bins)
+        self.set_possible_bins_matrix()
 
         # get fractional solution: it is completely defined by listing the first 'k' bins according to
         # the definition of the paper in section 2.1.
         # NOTE: 'k' = len(best_bins)
         try:
             best_bins = self.get_fist_best_bins()
+            self.sort_best_bins_by_unit_cost(best_bins)
             # get rounding : map all items somewhere, not neccessarily respecting the constraints.
             # NOTE: With another heuristic it might be needed to be run again, after a new bin is introduced.
             self.map_all_items_to_bins(best_bins, infra, ns)
@@ -438,6 +629,7 @@ class ConstructiveMapperFromFractional(AbstractMapper):
                     anything_left_to_improve = self.improve_item_to_bin_mappings(best_bins, infra, ns)
                 # get new bin : if there is nothing left to improve with the current bins, we can introduce new ones
                 best_bins, can_add_next_bin = self.get_new_best_bins(best_bins, infra, ns)
+                self.sort_best_bins_by_unit_cost(best_bins)
         except UnfeasibleBinPacking as ubp:
             self.log.exception(ubp.msg)
             raise ubp
@@ -452,9 +644,40 @@ class ConstructiveMapperFromFractional(AbstractMapper):
             self.log.error("Bin packing result does not respect some non-bin packing constraint!")
             raise Exception("Bin packing result does not respect some non-bin packing constraint!")
         else:
-            self.log.info("Bin packing solution found with objective value {}, while fractional optimal value is {}".
-                          format(self.objective_value_of_integer_solution, self.objective_value_of_fractional_opt))
+            self.log.info("Bin packing solution found with objective value %s, while fractional optimal value is %s",
+                          self.objective_value_of_integer_solution, self.objective_value_of_fractional_opt)
             mapping = self.construct_output_mapping(mapping)
 
         return mapping
 
+
+def solve_one(infra, ns, checker_cls=VolatileResourcesChecker) -> dict:
+    """
+    Solves a single problem instance with a fresh mapper, so it can be run in a worker process.
+    If the heuristic cannot solve the instance, the mapping is returned as not worked with the exception in 'error',
+    so one instance does not fail a whole batch.
+
+    :param infra:
+    :param ns:
+    :param checker_cls: AbstractChecker subclass to instantiate for the mapper
+    :return: mapping dict
+    """
+    try:
+        return ConstructiveMapperFromFractional(checker_cls()).map(infra, ns)
+    except (UnfeasibleBinPacking, NotImplementedError) as e:
+        return {'worked': False, 'error': e}
+
+
+def solve_all(problems, checker_cls=VolatileResourcesChecker, max_workers=None) -> list:
+    """
+    Solves independent problem instances in parallel on a process pool.
+
+    :param problems: iterable of (infra, ns) tuples
+    :param checker_cls: AbstractChecker subclass to instantiate for each mapper
+    :param max_workers: number of worker processes, defaults to the number of processors
+    :return: list of mapping dicts in the order of the problems
+    """
+    problems = list(problems)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(solve_one, [infra for infra, _ in problems], [ns for _, ns in problems],
+                                 [checker_cls] * len(problems)))
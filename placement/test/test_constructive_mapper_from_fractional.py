@@ -0,0 +1,323 @@
+import unittest
+import numpy as np
+import networkx as nx
+from placement import constructive_mapper_from_fractional as cmff
+
+
+class InfraGraph(nx.DiGraph):
+
+    """Minimal infrastructure graph with the attribute names read by the mapper"""
+
+    infra_node_capacity_str = 'capacity'
+    infra_fixed_cost_str = 'fixed_cost'
+    infra_unit_cost_str = 'unit_cost'
+
+    def check_graph(self):
+        return True
+
+
+class ServiceGraph(nx.DiGraph):
+
+    """Minimal network service graph with the attribute names read by the mapper"""
+
+    nf_demand_str = 'demand'
+    location_constr_str = 'location_constr'
+
+    def check_graph(self):
+        return True
+
+
+def pack_possible_bins(possible_bins, n_bins):
+    """Builds the uint64 bitmap of find_cheapest_move from lists of bin indices
+
+    :possible_bins: list of the possible bin indices for each item
+    :n_bins: number of bins
+    :returns: np.ndarray: 2D uint64 bitmap
+
+    """
+    possible = np.zeros((len(possible_bins), (n_bins + 63) // 64), dtype=np.uint64)
+    for i, bins in enumerate(possible_bins):
+        for b in bins:
+            possible[i, b // 64] |= np.uint64(1) << np.uint64(b % 64)
+    return possible
+
+
+class TestConstructiveMapperFromFractional(unittest.TestCase):
+
+    """Test case for the ConstructiveMapperFromFractional class"""
+
+    def setUp(self):
+        # b1 and b2 are the fractional optimal bins, b3 is introduced when
+        # no improvement is possible and b4 is only used by v4's constraint
+        infra = InfraGraph()
+        infra.add_node('b1', capacity=10, fixed_cost=0, unit_cost=1.0)
+        infra.add_node('b2', capacity=10, fixed_cost=5, unit_cost=1.5)
+        infra.add_node('b3', capacity=10, fixed_cost=20, unit_cost=0.5)
+        infra.add_node('b4', capacity=10, fixed_cost=40, unit_cost=0.1)
+        self.infra = infra
+
+        ns = ServiceGraph()
+        ns.add_node('v1', demand=6)
+        ns.add_node('v2', demand=6)
+        ns.add_node('v3', demand=6)
+        ns.add_node('v4', demand=1, location_constr=['b4'])
+        self.ns = ns
+
+    def test_map(self):
+        """Checks the chosen bins and the objective values of a fixed instance
+        :returns: None
+
+        """
+        mapper = cmff.ConstructiveMapperFromFractional(cmff.VolatileResourcesChecker())
+        mapping = mapper.map(self.infra, self.ns)
+
+        self.assertTrue(mapping['worked'])
+        self.assertEqual({item.id: item.mapped_to.id for item in mapper.items},
+                         {'v1': 'b2', 'v2': 'b3', 'v3': 'b1', 'v4': 'b4'})
+        self.assertAlmostEqual(mapper.objective_value_of_integer_solution, 83.1)
+        self.assertAlmostEqual(mapper.objective_value_of_fractional_opt, 28.5)
+
+    def test_improve_with_changed_best_bins(self):
+        """Checks that the improvement step searches the best bins it gets, even if they were not sorted by the mapper
+        :returns: None
+
+        """
+        mapper = cmff.ConstructiveMapperFromFractional(cmff.VolatileResourcesChecker())
+        mapper.get_base_bin_packing_problem(self.infra, self.ns)
+        for pruning in mapper.pruning_steps_collection:
+            mapper.items, mapper.bins = pruning.prune_possible_mappings(self.infra, self.ns, mapper.items, mapper.bins)
+        mapper.set_possible_bins_matrix()
+        best_bins = mapper.get_fist_best_bins()
+        mapper.map_all_items_to_bins(best_bins, self.infra, self.ns)
+        # the sorted bins are stale, they only contain b1, where all the items are mapped
+        mapper.sort_best_bins_by_unit_cost(best_bins[:1])
+
+        self.assertTrue(mapper.improve_item_to_bin_mappings(best_bins, self.infra, self.ns))
+        self.assertEqual(len(best_bins[1].mapped_here), 1)
+
+    def test_map_and_unmap_item(self):
+        """Checks that mapping and unmapping an item keeps the bins and the mapper arrays in sync
+        :returns: None
+
+        """
+        mapper = cmff.ConstructiveMapperFromFractional(cmff.VolatileResourcesChecker())
+        mapper.get_base_bin_packing_problem(self.infra, self.ns)
+        item, bin = mapper.items[0], mapper.bins[2]
+
+        mapper.map_item_to_bin(item, bin)
+        self.assertIs(item.mapped_to, bin)
+        self.assertEqual(bin.mapped_here, [item])
+        self.assertEqual(mapper._mapped_idx[item.idx], bin.idx)
+        self.assertEqual(mapper._loads[bin.idx], bin.total_load)
+
+        mapper.unmap_item_from_bin(item)
+        self.assertIsNone(item.mapped_to)
+        self.assertEqual(bin.mapped_here, [])
+        self.assertEqual(mapper._mapped_idx[item.idx], -1)
+        self.assertEqual(mapper._loads[bin.idx], 0)
+
+    def test_possible_bins_matrix(self):
+        """Checks the bitmap layout of the possible bins with more than 64 bins
+        :returns: None
+
+        """
+        infra = InfraGraph()
+        for b in range(70):
+            infra.add_node('b{}'.format(b), capacity=10, fixed_cost=1, unit_cost=1.0)
+        ns = ServiceGraph()
+        ns.add_node('v1', demand=1)
+        ns.add_node('v2', demand=1, location_constr=['b0', 'b63', 'b64', 'b69'])
+        mapper = cmff.ConstructiveMapperFromFractional(cmff.VolatileResourcesChecker())
+        mapper.get_base_bin_packing_problem(infra, ns)
+        for pruning in mapper.pruning_steps_collection:
+            mapper.items, mapper.bins = pruning.prune_possible_mappings(infra, ns, mapper.items, mapper.bins)
+        mapper.set_possible_bins_matrix()
+
+        bin_idx = {bin.id: bin.idx for bin in mapper.bins}
+        expected = pack_possible_bins([list(range(70)), [bin_idx[b] for b in ['b0', 'b63', 'b64', 'b69']]], 70)
+        self.assertEqual(mapper._possible.dtype, np.uint64)
+        np.testing.assert_array_equal(mapper._possible, expected)
+
+    def test_unfeasible(self):
+        """Checks that too heavy items raise UnfeasibleBinPacking
+        :returns: None
+
+        """
+        self.ns.add_node('v5', demand=30)
+        mapper = cmff.ConstructiveMapperFromFractional(cmff.VolatileResourcesChecker())
+        with self.assertRaises(cmff.UnfeasibleBinPacking):
+            mapper.map(self.infra, self.ns)
+
+    def test_check_bin_mapping_structure(self):
+        """Checks that a corrupted mapped_here structure raises
+        :returns: None
+
+        """
+        def mapped_mapper():
+            mapper = cmff.ConstructiveMapperFromFractional(cmff.VolatileResourcesChecker())
+            mapper.map(self.infra, self.ns)
+            bins = {bin.id: bin for bin in mapper.bins}
+            items = {item.id: item for item in mapper.items}
+            return mapper, bins, items
+
+        mapper, bins, items = mapped_mapper()
+        self.assertTrue(mapper.check_bin_mapping())
+
+        # duplicate item
+        bins['b1'].mapped_here.append(items['v3'])
+        with self.assertRaisesRegex(Exception, 'exactly one bin'):
+            mapper.check_bin_mapping()
+
+        # wrong back-pointer
+        mapper, bins, items = mapped_mapper()
+        bins['b1'].mapped_here.remove(items['v3'])
+        bins['b2'].mapped_here.append(items['v3'])
+        with self.assertRaisesRegex(Exception, 'exactly one bin'):
+            mapper.check_bin_mapping()
+
+        # missing item
+        mapper, bins, items = mapped_mapper()
+        bins['b1'].mapped_here.remove(items['v3'])
+        with self.assertRaisesRegex(Exception, 'not found'):
+            mapper.check_bin_mapping()
+
+    def test_check_other_constraints_without_pruning(self):
+        """Checks that the location constraints are checked even if they were not pruned
+        :returns: None
+
+        """
+        mapper = cmff.ConstructiveMapperFromFractional(cmff.VolatileResourcesChecker())
+        mapper.pruning_steps_collection = []
+        mapper.get_base_bin_packing_problem(self.infra, self.ns)
+        bins = {bin.id: bin for bin in mapper.bins}
+        items = {item.id: item for item in mapper.items}
+        for item_id, bin_id in [('v1', 'b1'), ('v2', 'b2'), ('v3', 'b3'), ('v4', 'b1')]:
+            mapper.map_item_to_bin(items[item_id], bins[bin_id])
+        self.assertFalse(mapper.check_other_constraints(self.infra, self.ns))
+
+        mapper.unmap_item_from_bin(items['v4'])
+        mapper.map_item_to_bin(items['v4'], bins['b4'])
+        self.assertTrue(mapper.check_other_constraints(self.infra, self.ns))
+
+    def test_has_overload_or_unmapped(self):
+        """Checks the cheap validity check of the main loop
+        :returns: None
+
+        """
+        mapper = cmff.ConstructiveMapperFromFractional(cmff.VolatileResourcesChecker())
+        mapper.get_base_bin_packing_problem(self.infra, self.ns)
+        bins = {bin.id: bin for bin in mapper.bins}
+        items = {item.id: item for item in mapper.items}
+        # nothing is mapped yet
+        self.assertTrue(mapper._has_overload_or_unmapped())
+
+        for item_id, bin_id in [('v1', 'b1'), ('v2', 'b2'), ('v3', 'b3')]:
+            mapper.map_item_to_bin(items[item_id], bins[bin_id])
+        # v4 is still unmapped
+        self.assertTrue(mapper._has_overload_or_unmapped())
+
+        mapper.map_item_to_bin(items['v4'], bins['b4'])
+        self.assertFalse(mapper._has_overload_or_unmapped())
+
+        # b1 gets overloaded
+        mapper.unmap_item_from_bin(items['v2'])
+        mapper.map_item_to_bin(items['v2'], bins['b1'])
+        self.assertTrue(mapper._has_overload_or_unmapped())
+
+    def test_output_mapping(self):
+        """Checks that the mapping contains the host of each VNF and the objective values
+        :returns: None
+
+        """
+        mapper = cmff.ConstructiveMapperFromFractional(cmff.VolatileResourcesChecker())
+        mapping = mapper.map(self.infra, self.ns)
+
+        self.assertEqual([mapping[v] for v in ['v1', 'v2', 'v3', 'v4']], ['b2', 'b3', 'b1', 'b4'])
+        self.assertAlmostEqual(mapping['objective_values']['integer_solution'], 83.1)
+        self.assertAlmostEqual(mapping['objective_values']['fractional_opt'], 28.5)
+
+    def test_solve_one(self):
+        """Checks that solve_one returns the mapping, or a failed one with the error
+        :returns: None
+
+        """
+        mapping = cmff.solve_one(self.infra, self.ns)
+        self.assertTrue(mapping['worked'])
+        self.assertEqual(mapping['v2'], 'b3')
+
+        self.ns.add_node('v5', demand=30)
+        mapping = cmff.solve_one(self.infra, self.ns)
+        self.assertFalse(mapping['worked'])
+        self.assertIsInstance(mapping['error'], cmff.UnfeasibleBinPacking)
+
+    def test_solve_all(self):
+        """Checks that an unfeasible instance does not fail the other ones
+        :returns: None
+
+        """
+        unfeasible_ns = ServiceGraph(self.ns)
+        unfeasible_ns.add_node('v5', demand=30)
+        mappings = cmff.solve_all([(self.infra, self.ns), (self.infra, unfeasible_ns), (self.infra, self.ns)],
+                                  max_workers=2)
+
+        self.assertEqual([m['worked'] for m in mappings], [True, False, True])
+        self.assertIsInstance(mappings[1]['error'], cmff.UnfeasibleBinPacking)
+        self.assertEqual(mappings[0], cmff.solve_one(self.infra, self.ns))
+        self.assertEqual(mappings[2]['v1'], 'b2')
+
+
+class TestFindCheapestMove(unittest.TestCase):
+
+    """Test case for the find_cheapest_move kernel"""
+
+    def setUp(self):
+        # 70 bins, so the possible bins span two uint64 words
+        self.n_bins = 70
+        self.unit_costs = np.full(self.n_bins, 2.0)
+        self.unit_costs[65] = 0.5
+        self.unit_costs[3] = 1.8
+        self.capacities = np.full(self.n_bins, 10.0)
+        self.weights = np.array([4.0, 2.0])
+        self.mapped_idx = np.array([0, 0], dtype=np.int64)
+        self.loads = np.zeros(self.n_bins)
+        self.loads[0] = 12.0
+        self.best_bins_by_unit_cost = np.array([65, 3, 0, 64], dtype=np.int64)
+
+    def find_cheapest_move(self, overloading_items, possible):
+        return cmff.find_cheapest_move(np.array(overloading_items, dtype=np.int64), self.mapped_idx,
+                                       self.weights, self.unit_costs, self.capacities, self.loads,
+                                       self.best_bins_by_unit_cost, possible)
+
+    def test_second_word(self):
+        """Checks that bins after the first 64 are found in the bitmap
+        :returns: None
+
+        """
+        possible = pack_possible_bins([[0, 3, 65], [0]], self.n_bins)
+        self.assertEqual(self.find_cheapest_move([0, 1], possible), (0, 65))
+
+    def test_word_boundary(self):
+        """Checks that bit 0 of the second word is bin 64, not bin 0
+        :returns: None
+
+        """
+        possible = pack_possible_bins([[64], [0]], self.n_bins)
+        self.assertEqual(self.find_cheapest_move([0, 1], possible), (0, 64))
+        possible = pack_possible_bins([[0], [0]], self.n_bins)
+        self.assertEqual(self.find_cheapest_move([0, 1], possible), (-1, -1))
+
+    def test_first_fitting_bin(self):
+        """Checks that a full cheaper bin is skipped for the next one
+        :returns: None
+
+        """
+        self.loads[65] = 8.0
+        possible = pack_possible_bins([[0, 3, 65], [0, 3, 65]], self.n_bins)
+        # item 1 still fits into bin 65 and moving it there is cheaper than moving item 0 to bin 3
+        self.assertEqual(self.find_cheapest_move([0, 1], possible), (1, 65))
+        self.loads[65] = 9.0
+        self.assertEqual(self.find_cheapest_move([0, 1], possible), (0, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,7 +24,9 @@ setup(name='placement',
       packages=['placement', 'placement.test'],
       install_requires=[
           'networkx==2.2',
-          'haversine'
+          'haversine',
+          'numpy>=1.17',
+          'numba'
       ],
       # test_suite='nose.collector',
       # tests_require=['nose', 'nose-cover3'],